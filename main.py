@@ -1,29 +1,134 @@
+import asyncio
+import logging
 import os
-from fastapi import FastAPI, HTTPException
+import re
+import time
+import msgspec
+import orjson
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.openapi.utils import (
+    get_openapi,
+    validation_error_definition,
+    validation_error_response_definition,
+)
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+from typing import Annotated, List, Literal, Optional
+from pydantic import Field, TypeAdapter, computed_field
+import bson
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from redis.exceptions import RedisError
 
-from database import db, create_document, get_documents
+from database import db, cache, create_document, create_documents, get_documents
 from schemas import Product, Order, OrderItem
 
-app = FastAPI(title="Jaggery Store API")
+PRODUCTS_CACHE_KEY = "products:v2"
+PRODUCTS_CACHE_TTL = 300  # seconds
+
+PRODUCT_CACHE_REFRESH_INTERVAL = 60  # seconds
+PRODUCT_FIELDS = {"title": 1, "price_cents": 1}
+COLLECTIONS_CACHE_TTL = 5  # seconds
+
+logger = logging.getLogger(__name__)
+
+_ROOT_BODY = orjson.dumps({"message": "Jaggery Store Backend"})
+
+_OID_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+# In-process copy of the (small) catalog used by checkout, keyed by str(_id)
+_product_cache: dict = {}
+
+async def refresh_product_cache():
+    global _product_cache
+    docs = await db["product"].find({}, PRODUCT_FIELDS).to_list(length=None)
+    _product_cache = {str(d["_id"]): d for d in docs}
+
+async def try_refresh_product_cache():
+    try:
+        await refresh_product_cache()
+    except Exception:
+        # keep serving the previous snapshot; checkout falls back to Mongo on misses
+        logger.warning("Product cache refresh failed", exc_info=True)
+
+async def _product_cache_refresh_loop():
+    while True:
+        await try_refresh_product_cache()
+        await asyncio.sleep(PRODUCT_CACHE_REFRESH_INTERVAL)
+
+async def migrate_price_cents():
+    """Backfill price_cents on product documents stored with a float dollar price"""
+    await db["product"].update_many(
+        {"price_cents": {"$exists": False}, "price": {"$type": "number"}},
+        [{"$set": {"price_cents": {"$toInt": {"$round": [{"$multiply": ["$price", 100]}, 0]}}}}],
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresh_task = None
+    if db is not None:
+        # Startup failures are logged rather than raised so the app still serves
+        # /test, which reports the database state
+        try:
+            # open the pool's connections before serving traffic
+            await db.command("ping")
+            # partial filter so products without a SKU don't collide on null
+            await db["product"].create_index(
+                "sku", unique=True, partialFilterExpression={"sku": {"$type": "string"}}
+            )
+        except Exception:
+            logger.exception("Database setup failed at startup")
+        try:
+            await migrate_price_cents()
+        except Exception:
+            logger.exception("price_cents migration failed at startup")
+        refresh_task = asyncio.create_task(_product_cache_refresh_loop())
+    try:
+        yield
+    finally:
+        if refresh_task is not None:
+            refresh_task.cancel()
+        if db is not None:
+            db.client.close()
+        if cache is not None:
+            await cache.aclose()
+
+app = FastAPI(title="Jaggery Store API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Comma-separated list of allowed frontend origins, e.g. "https://shop.example.com"
+cors_origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)
+
 @app.get("/")
-def read_root():
-    return {"message": "Jaggery Store Backend"}
+async def read_root():
+    return Response(_ROOT_BODY, media_type="application/json")
+
+# Short-lived cache of collection names so health-check pollers don't hit Mongo every time
+_collections_cache: Optional[List[str]] = None
+_collections_cache_ts = 0.0
+
+async def list_collection_names_cached() -> List[str]:
+    global _collections_cache, _collections_cache_ts
+    now = time.monotonic()
+    if _collections_cache is None or now - _collections_cache_ts > COLLECTIONS_CACHE_TTL:
+        _collections_cache = await db.list_collection_names()
+        _collections_cache_ts = now
+    return _collections_cache
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -39,7 +144,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await list_collection_names_cached()
                 response["collections"] = collections
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -50,89 +155,206 @@ def test_database():
         response["database"] = f"❌ Error: {str(e)[:50]}"
     return response
 
+# The Redis cache is best-effort: on any Redis error fall through to Mongo
+async def get_cached_products() -> Optional[bytes]:
+    if cache is None:
+        return None
+    try:
+        return await cache.get(PRODUCTS_CACHE_KEY)
+    except RedisError:
+        logger.warning("Redis get failed for %s", PRODUCTS_CACHE_KEY, exc_info=True)
+        return None
+
+async def set_cached_products(body: bytes):
+    if cache is None:
+        return
+    try:
+        await cache.setex(PRODUCTS_CACHE_KEY, PRODUCTS_CACHE_TTL, body)
+    except RedisError:
+        logger.warning("Redis setex failed for %s", PRODUCTS_CACHE_KEY, exc_info=True)
+
+async def invalidate_cached_products():
+    if cache is None:
+        return
+    try:
+        await cache.delete(PRODUCTS_CACHE_KEY)
+    except RedisError:
+        logger.warning("Redis delete failed for %s", PRODUCTS_CACHE_KEY, exc_info=True)
+
 # Seed a single product (1kg and 500g jaggery powder variants)
 @app.post("/seed")
-def seed_products():
+async def seed_products():
     try:
-        existing = list(db["product"].find({"sku": {"$in": ["JAG-500", "JAG-1000"]}})) if db else []
+        existing = await db["product"].count_documents({"sku": {"$in": ["JAG-500", "JAG-1000"]}}, limit=1) if db is not None else 0
         if existing:
             return {"inserted": 0, "message": "Products already exist"}
-        p1 = Product(
+        p1 = Product.model_construct(
             title="Jaggery Powder 500g",
             description="Pure, chemical-free jaggery powder. Perfect for tea, coffee and cooking.",
-            price=2.49,
+            price_cents=249,
             category="jaggery",
             in_stock=True,
             image="/jaggery-500.jpg",
             sku="JAG-500",
             weight_g=500
         )
-        p2 = Product(
+        p2 = Product.model_construct(
             title="Jaggery Powder 1kg",
             description="Pure, chemical-free jaggery powder family pack.",
-            price=4.49,
+            price_cents=449,
             category="jaggery",
             in_stock=True,
             image="/jaggery-1000.jpg",
             sku="JAG-1000",
             weight_g=1000
         )
-        create_document("product", p1)
-        create_document("product", p2)
-        return {"inserted": 2}
+        try:
+            inserted_ids = await create_documents("product", [p1, p2])
+        except BulkWriteError as e:
+            # a concurrent seed won the race; the unique sku index rejected the duplicates
+            await invalidate_cached_products()
+            await try_refresh_product_cache()
+            return {"inserted": e.details.get("nInserted", 0), "message": "Products already exist"}
+        # the insert succeeded; a failed reload is logged and picked up by the refresh loop
+        await invalidate_cached_products()
+        await try_refresh_product_cache()
+        return {"inserted": len(inserted_ids), "ids": inserted_ids}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class ProductOut(Product):
+    """Product as returned by /products"""
+    id: str = Field(..., serialization_alias="_id")
+
+    @computed_field
+    @property
+    def price(self) -> float:
+        return self.price_cents / 100
+
+_PRODUCT_LIST_ADAPTER = TypeAdapter(List[ProductOut])
+
 @app.get("/products")
-def list_products():
+async def list_products():
     try:
-        items = get_documents("product")
-        for it in items:
-            it["_id"] = str(it["_id"]) if "_id" in it else None
-        return items
+        cached = await get_cached_products()
+        if cached:
+            return Response(cached, media_type="application/json")
+        items = await get_documents("product")
+        # documents come from our own collection, so skip re-validating them
+        products = [ProductOut.model_construct(id=str(it.pop("_id")), **it) for it in items]
+        body = _PRODUCT_LIST_ADAPTER.dump_json(products, by_alias=True)
+        await set_cached_products(body)
+        return Response(body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-class CartItem(BaseModel):
+# Checkout bodies are decoded with msgspec rather than Pydantic, so the
+# request schema is published to OpenAPI by hand (see custom_openapi below)
+class CartItem(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
     product_id: str
-    quantity: int
+    quantity: Annotated[int, msgspec.Meta(ge=1, le=1000)]
 
-class CheckoutRequest(BaseModel):
+class CheckoutRequest(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
     name: str
     email: str
-    phone: str
+    phone: Annotated[str, msgspec.Meta(min_length=7, max_length=20)]
     address_line: str
     city: str
-    pincode: str
-    payment_method: str  # cod | card (mock)
-    cart: List[CartItem]
+    pincode: Annotated[str, msgspec.Meta(min_length=3, max_length=10)]
+    payment_method: Literal["cod", "card"]  # card is mocked
+    cart: Annotated[List[CartItem], msgspec.Meta(min_length=1)]
 
-@app.post("/checkout")
-def checkout(payload: CheckoutRequest):
+_checkout_decoder = msgspec.json.Decoder(CheckoutRequest)
+
+async def persist_order(order_doc: dict):
+    """Background insert for COD orders; the client already has the order id"""
     try:
-        # fetch products
-        ids = [ObjectId(ci.product_id) for ci in payload.cart]
-        products = list(db["product"].find({"_id": {"$in": ids}}))
-        product_map = {str(p["_id"]): p for p in products}
+        await create_document("order", order_doc)
+    except Exception:
+        logger.exception("Failed to persist order %s", order_doc.get("_id"))
 
-        items: List[OrderItem] = []
-        subtotal = 0.0
+_MSGSPEC_PATH_RE = re.compile(r"\.(\w+)|\[(\d+)\]")
+
+def _decode_error_detail(e: msgspec.DecodeError) -> list:
+    """Shape a msgspec error like FastAPI's request validation errors"""
+    msg, _, path = str(e).partition(" - at `")
+    loc: list = ["body"]
+    for key, index in _MSGSPEC_PATH_RE.findall(path.rstrip("`")):
+        loc.append(key if key else int(index))
+    error_type = "value_error" if isinstance(e, msgspec.ValidationError) else "json_invalid"
+    return [{"loc": loc, "msg": msg, "type": error_type}]
+
+@app.post(
+    "/checkout",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/CheckoutRequest"}}},
+        }
+    },
+    responses={
+        202: {"description": "COD order accepted; it is stored after the response is sent"},
+        422: {
+            "description": "Validation Error",
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/HTTPValidationError"}}},
+        }
+    },
+)
+async def checkout(request: Request, response: Response, background_tasks: BackgroundTasks):
+    try:
+        payload = _checkout_decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=_decode_error_detail(e))
+
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database not available")
+
+    try:
         for ci in payload.cart:
-            prod = product_map.get(ci.product_id)
+            if not _OID_RE.fullmatch(ci.product_id):
+                raise HTTPException(status_code=400, detail=f"Invalid product id {ci.product_id}")
+        # product maps are keyed by str(ObjectId), which is lowercase hex
+        product_ids = [ci.product_id.lower() for ci in payload.cart]
+
+        # fetch products, from the in-process cache first and Mongo for the rest
+        product_map = {}
+        missing = []
+        for product_id in set(product_ids):
+            prod = _product_cache.get(product_id)
+            if prod is None:
+                missing.append(ObjectId(product_id))
+            else:
+                product_map[product_id] = prod
+        if missing:
+            products = await db["product"].find(
+                {"_id": {"$in": missing}}, PRODUCT_FIELDS
+            ).to_list(length=len(missing))
+            product_map.update({str(p["_id"]): p for p in products})
+
+        # request data is validated by CheckoutRequest; order values below are
+        # computed in-process, so build models without re-validating them
+        items: List[OrderItem] = []
+        subtotal_cents = 0
+        append_item = items.append
+        make_item = OrderItem.model_construct
+        get_product = product_map.get
+        for product_id, ci in zip(product_ids, payload.cart):
+            prod = get_product(product_id)
             if not prod:
                 raise HTTPException(status_code=404, detail=f"Product {ci.product_id} not found")
-            line_total = float(prod.get("price", 0)) * ci.quantity
-            subtotal += line_total
-            items.append(OrderItem(
-                product_id=ci.product_id,
-                title=prod.get("title"),
-                price=float(prod.get("price", 0)),
-                quantity=ci.quantity
+            price_cents = prod["price_cents"]
+            quantity = ci.quantity
+            subtotal_cents += price_cents * quantity
+            append_item(make_item(
+                product_id=product_id,
+                title=prod["title"],
+                price_cents=price_cents,
+                quantity=quantity
             ))
-        shipping = 0.0 if subtotal >= 10 else 1.0
-        total = subtotal + shipping
+        shipping_cents = 0 if subtotal_cents >= 1000 else 100
+        total_cents = subtotal_cents + shipping_cents
 
-        order = Order(
+        order = Order.model_construct(
             customer_name=payload.name,
             email=payload.email,
             phone=payload.phone,
@@ -141,25 +363,61 @@ def checkout(payload: CheckoutRequest):
             pincode=payload.pincode,
             payment_method=payload.payment_method,
             items=items,
-            subtotal=round(subtotal, 2),
-            shipping=round(shipping, 2),
-            total=round(total, 2),
+            subtotal_cents=subtotal_cents,
+            shipping_cents=shipping_cents,
+            total_cents=total_cents,
             status="paid" if payload.payment_method == "card" else "pending"
         )
-        order_id = create_document("order", order)
 
         # Mock payment intent for "card" method
         payment_info = None
         if payload.payment_method == "card":
+            order_id = await create_document("order", order)
             payment_info = {"provider": "mock", "status": "succeeded", "transaction_id": order_id}
+        else:
+            # COD orders don't need the write on the critical path: assign the id
+            # here and persist after the response has been sent
+            oid = ObjectId()
+            order_id = str(oid)
+            order_doc = order.model_dump()
+            order_doc["_id"] = oid
+            # make sure the document can be stored before promising it to the client;
+            # errors here fall through to the 500 handler below
+            bson.encode(order_doc)
+            background_tasks.add_task(persist_order, order_doc)
+            response.status_code = 202
 
-        return {"order_id": order_id, "total": order.total, "status": order.status, "payment": payment_info}
+        return {"order_id": order_id, "total": total_cents / 100, "status": order.status, "payment": payment_info}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def custom_openapi():
+    if app.openapi_schema is None:
+        schema = get_openapi(title=app.title, version=app.version, routes=app.routes)
+        _, components = msgspec.json.schema_components(
+            [CheckoutRequest], ref_template="#/components/schemas/{name}"
+        )
+        schemas = schema.setdefault("components", {}).setdefault("schemas", {})
+        schemas.update(components)
+        schemas.setdefault("ValidationError", validation_error_definition)
+        schemas.setdefault("HTTPValidationError", validation_error_response_definition)
+        app.openapi_schema = schema
+    return app.openapi_schema
+
+app.openapi = custom_openapi
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        # each worker holds its own Mongo pool, so keep the default worker count small
+        workers=int(os.getenv("WEB_CONCURRENCY", min(os.cpu_count() or 1, 4))),
+        loop="auto",  # uvloop when installed (not on Windows), asyncio otherwise
+        http="httptools",
+        access_log=False,
+    )
@@ -12,7 +12,7 @@ Model name is converted to lowercase for the collection name:
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 class User(BaseModel):
     """
@@ -32,7 +32,7 @@ class Product(BaseModel):
     """
     title: str = Field(..., description="Product title")
     description: Optional[str] = Field(None, description="Product description")
-    price: float = Field(..., ge=0, description="Price in dollars")
+    price_cents: int = Field(..., ge=0, description="Price in cents")
     category: str = Field(..., description="Product category")
     in_stock: bool = Field(True, description="Whether product is in stock")
     image: Optional[str] = Field(None, description="Image URL")
@@ -42,7 +42,7 @@ class Product(BaseModel):
 class OrderItem(BaseModel):
     product_id: str = Field(..., description="Associated product ID")
     title: str = Field(..., description="Product title at time of order")
-    price: float = Field(..., ge=0, description="Unit price at time of order")
+    price_cents: int = Field(..., ge=0, description="Unit price in cents at time of order")
     quantity: int = Field(..., ge=1, description="Quantity of this item")
 
 class Order(BaseModel):
@@ -56,9 +56,9 @@ class Order(BaseModel):
     address_line: str = Field(...)
     city: str = Field(...)
     pincode: str = Field(...)
-    payment_method: str = Field(..., description="cod | card")
+    payment_method: Literal["cod", "card"] = Field(..., description="cod | card")
     items: List[OrderItem] = Field(...)
-    subtotal: float = Field(..., ge=0)
-    shipping: float = Field(..., ge=0)
-    total: float = Field(..., ge=0)
+    subtotal_cents: int = Field(..., ge=0)
+    shipping_cents: int = Field(..., ge=0)
+    total_cents: int = Field(..., ge=0)
     status: str = Field("pending", description="Order status")